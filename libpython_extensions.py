@@ -1,9 +1,11 @@
-import dis
 import functools
+import io
+import json
 import os
 import pathlib
+import re
 import sys
-from typing import Optional
+from typing import Callable, Optional
 
 import gdb
 from src.udbpy.gdb_extensions import command
@@ -14,16 +16,23 @@ import libpython
 gdb.execute("alias -a pp = py-print")
 
 
-@functools.cache
+# Python versions keyed by program space. Invalidated when a new objfile is loaded, since
+# "file", "attach" or re-"run" can put a different Python in front of us.
+_python_versions_cache: dict[int, tuple[str, str]] = {}
+
+
 def get_python_versions() -> tuple[str, str]:
     """
     Get the inferior and the debugger Python versions.
     """
-    inferior_version = gdb.parse_and_eval("PY_VERSION").string()
-    debugger_version = ".".join(
-        map(str, (sys.version_info.major, sys.version_info.minor))
-    )
-    return inferior_version, debugger_version
+    key = id(gdb.current_progspace())
+    if key not in _python_versions_cache:
+        inferior_version = gdb.parse_and_eval("PY_VERSION").string()
+        debugger_version = ".".join(
+            map(str, (sys.version_info.major, sys.version_info.minor))
+        )
+        _python_versions_cache[key] = (inferior_version, debugger_version)
+    return _python_versions_cache[key]
 
 
 def check_python_bytecode_version() -> None:
@@ -50,30 +59,36 @@ def check_python_bytecode_version() -> None:
         )
 
 
-class PyDisassemble(gdb.Command):
+def get_inferior_bytes(bytes_object: libpython.PyObjectPtr) -> bytes:
     """
-    Disassemble the bytecode for the currently selected Python frame.
+    Read the contents of an inferior bytes object directly out of its memory.
+
+    This avoids stringifying the object, which costs a Python-level call per byte.
     """
+    try:
+        size = int(bytes_object.field("ob_size"))
+        address = int(bytes_object.field("ob_sval").address)
+        return bytes(gdb.selected_inferior().read_memory(address, size))
+    except gdb.error:
+        # Fall back to the stringification path. Its code points are all <= 255, so latin-1
+        # widens them back to bytes in a single C call rather than one ord() per byte.
+        return str(bytes_object).encode("latin-1")
 
-    def __init__(self):
-        gdb.Command.__init__(self, "py-dis", gdb.COMMAND_STACK, gdb.COMPLETE_NONE)
 
-    def invoke(self, args, from_tty):
-        check_python_bytecode_version()
+# Code object metadata keyed by code object address. The fields are immutable for the lifetime
+# of the code object, and each read deep-traverses inferior memory. Once the inferior resumes a
+# freed code object's address can be reused, so entries only live until then.
+_co_metadata_cache: dict[int, tuple] = {}
 
-        frame = libpython.Frame.get_selected_bytecode_frame()
-        if not frame:
-            print("Unable to find frame with bytecode")
-            return
 
-        frame_object = frame.get_pyop()
-        # f_lasti is a wordcode index and so must be multiplied by 2 to get byte offset, see cpyton
-        # commit fc840736e54da0557616882012f362b809490165.
-        byte_index = frame_object.f_lasti * 2
-        bytes_object = frame_object.co.pyop_field("co_code")
-
-        varnames, names, consts, cellvars, freevars = (
-            frame_object.co.pyop_field(name).proxyval(set())
+def get_co_metadata(co: libpython.PyCodeObjectPtr) -> tuple:
+    """
+    Return the (varnames, names, consts, cellvars, freevars) proxy values for a code object.
+    """
+    key = co.as_address()
+    if key not in _co_metadata_cache:
+        _co_metadata_cache[key] = tuple(
+            co.pyop_field(name).proxyval(set())
             for name in (
                 "co_varnames",
                 "co_names",
@@ -82,15 +97,76 @@ class PyDisassemble(gdb.Command):
                 "co_freevars",
             )
         )
+    return _co_metadata_cache[key]
+
+
+# Rendered disassembly keyed by (code object address, byte index). The current-instruction
+# marker depends on f_lasti, so entries are dropped when the inferior resumes.
+_disassembly_cache: dict[tuple[int, int], str] = {}
+
+
+def _clear_disassembly_caches(event) -> None:
+    _co_metadata_cache.clear()
+    _disassembly_cache.clear()
+
+
+gdb.events.cont.connect(_clear_disassembly_caches)
+
+
+def get_frame_disassembly(frame: libpython.Frame) -> str:
+    """
+    Return the bytecode disassembly for the given Python frame, with the current instruction
+    marked.
+
+    The rendered text is cached so TUI redraws at the same stop don't repeat the inferior
+    memory traversals.
+    """
+    frame_object = frame.get_pyop()
+    if not frame_object or frame_object.is_optimized_out():
+        raise gdb.GdbError(libpython.UNABLE_READ_INFO_PYTHON_FRAME)
+    # f_lasti is a wordcode index and so must be multiplied by 2 to get byte offset, see cpyton
+    # commit fc840736e54da0557616882012f362b809490165.
+    byte_index = frame_object.f_lasti * 2
+    key = (frame_object.co.as_address(), byte_index)
+    if key not in _disassembly_cache:
+        bytes_object = frame_object.co.pyop_field("co_code")
+        varnames, names, consts, cellvars, freevars = get_co_metadata(frame_object.co)
 
+        # Imported on first use: dis builds its opcode tables at import, which would
+        # otherwise be paid at every gdb startup.
+        import dis
+
+        output = io.StringIO()
         dis._disassemble_bytes(
-            bytes(map(ord, str(bytes_object))),
+            get_inferior_bytes(bytes_object),
             byte_index,
             varnames,
             names,
             consts,
             cellvars + freevars,
+            file=output,
         )
+        _disassembly_cache[key] = output.getvalue()
+    return _disassembly_cache[key]
+
+
+class PyDisassemble(gdb.Command):
+    """
+    Disassemble the bytecode for the currently selected Python frame.
+    """
+
+    def __init__(self):
+        gdb.Command.__init__(self, "py-dis", gdb.COMMAND_STACK, gdb.COMPLETE_NONE)
+
+    def invoke(self, args, from_tty):
+        check_python_bytecode_version()
+
+        frame = libpython.Frame.get_selected_bytecode_frame()
+        if not frame:
+            print("Unable to find frame with bytecode")
+            return
+
+        print(get_frame_disassembly(frame), end="")
 
 
 PyDisassemble()
@@ -111,6 +187,30 @@ def get_frame_function_name(frame: libpython.Frame) -> str | None:
     return None
 
 
+# Function names resolved at the current stop. Resolving a name walks inferior memory with
+# proxyval, so the result is kept until the inferior moves again.
+_function_name_cache: dict[str, Optional[str]] = {}
+
+
+def _cache_per_stop(function):
+    """
+    Cache the result of a nullary function until the inferior next stops or resumes.
+    """
+
+    @functools.wraps(function)
+    def wrapper():
+        name = function.__name__
+        if name not in _function_name_cache:
+            _function_name_cache[name] = function()
+        return _function_name_cache[name]
+
+    return wrapper
+
+
+gdb.events.cont.connect(lambda event: _function_name_cache.clear())
+
+
+@_cache_per_stop
 def get_evalframe_function_name() -> Optional[str]:
     """
     Attempt to return the name of the function in this eval frame.
@@ -119,6 +219,7 @@ def get_evalframe_function_name() -> Optional[str]:
     return get_frame_function_name(python_frame)
 
 
+@_cache_per_stop
 def get_cfunction_name() -> str:
     """
     Return the name of the C-implemented function which is executing on this cpython frame.
@@ -140,9 +241,46 @@ class ConditionalBreakpoint(gdb.Breakpoint):
         super().__init__(*args, **kwargs)
 
     def stop(self):
+        # Each hit is a fresh stop, so drop names resolved at the previous one.
+        _function_name_cache.clear()
         return self.predicate()
 
 
+# The entry points through which the interpreter calls C-implemented and Python functions,
+# each with the resolver for the name of the function being called there.
+CALL_ENTRY_POINTS = (
+    ("cfunction_enter_call", get_cfunction_name),
+    ("_PyEval_EvalFrameDefault", get_evalframe_function_name),
+)
+
+
+class PythonCallBreakpoint(gdb.Breakpoint):
+    """
+    Persistent internal breakpoint on one of the interpreter's function call entry points.
+
+    The inferior is stopped when the name of the called function matches the class-level
+    target name. Instances are created once and toggled, so repeated searches don't pay
+    breakpoint creation and deletion bookkeeping.
+    """
+
+    # The Python function name being searched for, set by advance_function.
+    target_name: Optional[str] = None
+
+    def __init__(self, location: str, get_name: Callable[[], Optional[str]]):
+        super().__init__(location, internal=True)
+        self.silent = True
+        self.enabled = False
+        self.get_name = get_name
+
+    def stop(self):
+        # Each hit is a fresh stop, so drop names resolved at the previous one.
+        _function_name_cache.clear()
+        return self.get_name() == type(self).target_name
+
+
+_advance_breakpoints: list[PythonCallBreakpoint] = []
+
+
 def advance_function(forward: bool, function_name: str) -> None:
     """
     Continue the program forwards or backwards until the next time a Python function is called.
@@ -156,23 +294,43 @@ def advance_function(forward: bool, function_name: str) -> None:
         )
         print(f"Running {direction} until {target}.")
 
-        breakpoints = []
-        for location, get_name in [
-            ("cfunction_enter_call", get_cfunction_name),
-            ("_PyEval_EvalFrameDefault", get_evalframe_function_name),
-        ]:
-            bp = ConditionalBreakpoint(
-                location,
-                internal=True,
-                predicate=lambda f=get_name: not function_name or f() == function_name,
-            )
-            bp.silent = True
-            breakpoints.append(bp)
+        if function_name:
+            if not _advance_breakpoints:
+                _advance_breakpoints.extend(
+                    PythonCallBreakpoint(location, get_name)
+                    for location, get_name in CALL_ENTRY_POINTS
+                )
+            PythonCallBreakpoint.target_name = function_name
+            transient = []
+            for bp in _advance_breakpoints:
+                bp.enabled = True
+        else:
+            # Any Python call will do, so plain breakpoints avoid a Python predicate
+            # round-trip on every hit.
+            transient = [
+                gdb.Breakpoint(location, internal=True)
+                for location, _ in CALL_ENTRY_POINTS
+            ]
+            if forward:
+                # Returning from the current function is also a boundary worth stopping at:
+                # it bounds the search so we don't run through unrelated code to find a
+                # call. Whichever of the breakpoints fires first ends the search.
+                try:
+                    transient.append(gdb.FinishBreakpoint(internal=True))
+                except ValueError:
+                    # There is no caller frame to finish to.
+                    pass
+            for bp in transient:
+                bp.silent = True
         try:
             gdb.execute("continue" if forward else "reverse-continue")
         finally:
-            for bp in breakpoints:
-                bp.delete()
+            for bp in transient:
+                # A FinishBreakpoint deletes itself when hit or when its frame is popped.
+                if bp.is_valid():
+                    bp.delete()
+            for bp in _advance_breakpoints:
+                bp.enabled = False
 
 
 class PythonAdvanceFunction(gdb.Command):
@@ -207,6 +365,32 @@ PythonReverseAdvanceFunction()
 gdb.execute("alias -a pyra = py-reverse-advance")
 
 
+# Global symbols known to live in a given source file. Looking one up resolves the file path
+# through the symbol table directly, avoiding a parse of the full "info sources" output.
+SOURCE_FILE_ANCHORS = {
+    "ceval.c": "_PyEval_EvalFrameDefault",
+}
+
+
+@functools.cache
+def get_c_source_filename(basename: str) -> str:
+    """
+    Return the full path of a source file matching the given basename.
+
+    The basename is matched against source files currently known to the debugger.
+    """
+    anchor = SOURCE_FILE_ANCHORS.get(basename)
+    if anchor:
+        symbol = gdb.lookup_global_symbol(anchor)
+        if symbol is not None and symbol.symtab is not None:
+            filename = symbol.symtab.fullname()
+            if basename in filename:
+                return filename
+    sources = gdb.execute(f"info sources {basename}", to_string=True).splitlines()
+    filename, *_ = (f for f in sources if basename in f)
+    return filename
+
+
 @functools.cache
 def get_c_source_location(basename: str, content: str) -> str:
     """
@@ -217,19 +401,33 @@ def get_c_source_location(basename: str, content: str) -> str:
 
     Raises a ValueError if the file or content wasn't found.
     """
-    sources = gdb.execute(f"info sources {basename}", to_string=True).splitlines()
-    filename, *_ = (f for f in sources if basename in f)
-    lines = pathlib.Path(filename).read_text().splitlines()
-    for lineno, line in enumerate(lines):
-        if content in line:
-            return f"{basename}:{lineno}"
-    raise ValueError(f"Failed to find {content=} in {basename=}")
+    filename = get_c_source_filename(basename)
+    text = pathlib.Path(filename).read_text()
+    # str.find and str.count run at C speed, avoiding a Python-level loop over every line.
+    position = text.find(content)
+    if position < 0:
+        raise ValueError(f"Failed to find {content=} in {basename=}")
+    lineno = text.count("\n", 0, position)
+    return f"{basename}:{lineno}"
+
+
+@functools.cache
+def get_valid_opcodes() -> frozenset[int]:
+    """
+    Return the set of valid opcode numbers, computed once so lookups don't rescan the opmap.
+    """
+    import dis
+
+    return frozenset(dis.opmap.values())
 
 
+@functools.cache
 def get_opcode_number(opcode: str) -> int:
     """
     Translate opcode string to opcode number.
     """
+    import dis
+
     check_python_bytecode_version()
     try:
         return dis.opmap[opcode]
@@ -237,7 +435,7 @@ def get_opcode_number(opcode: str) -> int:
         pass
     try:
         opcode_number = int(opcode)
-        if opcode_number in dis.opmap.values():
+        if opcode_number in get_valid_opcodes():
             return opcode_number
     except ValueError:
         pass
@@ -247,6 +445,41 @@ def get_opcode_number(opcode: str) -> int:
     )
 
 
+# Linespec of the interpreter loop's dispatch_opcode label, keyed by inferior Python version.
+_dispatch_location_cache: dict[str, str] = {}
+
+
+def get_dispatch_opcode_location() -> str:
+    """
+    Return linespec for the dispatch_opcode label in the bytecode interpreter loop.
+
+    The label's position is stable per CPython build, so it is persisted on disk keyed by the
+    inferior's Python version, sparing later debug sessions the source file scan.
+    """
+    inferior_version, _ = get_python_versions()
+    if inferior_version in _dispatch_location_cache:
+        return _dispatch_location_cache[inferior_version]
+
+    cache_file = (
+        pathlib.Path("~/.cache/undo-python-debugging").expanduser()
+        / f"dispatch_opcode.{inferior_version}.json"
+    )
+    try:
+        location = json.loads(cache_file.read_text())["linespec"]
+        if not isinstance(location, str):
+            raise ValueError(f"cached linespec is not a string: {location!r}")
+    except (OSError, ValueError, KeyError, TypeError):
+        location = get_c_source_location("ceval.c", "dispatch_opcode:")
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            cache_file.write_text(json.dumps({"linespec": location}))
+        except OSError:
+            # Persisting the location is best-effort; the in-memory cache still applies.
+            pass
+    _dispatch_location_cache[inferior_version] = location
+    return location
+
+
 def python_step_bytecode(*, forwards: bool, opcode: str | None) -> None:
     """
     Continue the program forwards or backwards until the next Python bytecode.
@@ -254,11 +487,10 @@ def python_step_bytecode(*, forwards: bool, opcode: str | None) -> None:
     Accepts an optional target opcode.
     """
     try:
-        basename = "ceval.c"
-        location = get_c_source_location(basename, "dispatch_opcode:")
+        location = get_dispatch_opcode_location()
     except ValueError:
         raise gdb.GdbError(
-            f"Failed to find Python bytecode interpreter loop in {basename}"
+            "Failed to find Python bytecode interpreter loop in ceval.c"
         )
     with debugger_utils.breakpoints_suspended():
         try:
@@ -373,19 +605,26 @@ class PythonLastAttribute(gdb.Command):
             )
 
         def predicate():
+            # Check the object address first: it is a plain register/stack read, while
+            # resolving the attribute name proxyval-walks inferior memory.
             frame = gdb.selected_frame()
             if frame.read_var("v") != self.object_addr:
                 return False
-            if self.attribute_name:
-                name_ptr = gdb.selected_frame().read_var("name")
-                name = libpython.PyObjectPtr.from_pyobject_ptr(name_ptr).proxyval(set())
-                return name == self.attribute_name
-            return True
+            name_ptr = frame.read_var("name")
+            name = libpython.PyObjectPtr.from_pyobject_ptr(name_ptr).proxyval(set())
+            return name == self.attribute_name
 
         with debugger_utils.breakpoints_suspended():
-            bp = ConditionalBreakpoint(
-                "PyObject_SetAttr", internal=True, predicate=predicate
-            )
+            if self.attribute_name:
+                bp = ConditionalBreakpoint(
+                    "PyObject_SetAttr", internal=True, predicate=predicate
+                )
+            else:
+                # With no attribute filter the whole condition can be evaluated natively,
+                # which is orders of magnitude faster than a Python stop() callback on
+                # programs with heavy attribute churn.
+                bp = gdb.Breakpoint("PyObject_SetAttr", internal=True)
+                bp.condition = f"v == (PyObject *){self.object_addr}"
             bp.silent = True
             try:
                 gdb.execute("reverse-continue" if self.backwards else "continue")
@@ -408,6 +647,10 @@ class PythonSubstitutePath(gdb.Command):
 
     substitutions: list[tuple[str, str]] = []
 
+    # Substitution rules compiled into a single alternation, rebuilt whenever the rules change.
+    _pattern: re.Pattern | None = None
+    _replacements: dict[str, str] = {}
+
     def __init__(self):
         super().__init__("py-substitute-path", gdb.COMMAND_FILES)
 
@@ -420,6 +663,7 @@ class PythonSubstitutePath(gdb.Command):
 
         if arg == "clear":
             self.substitutions.clear()
+            self._rebuild_pattern()
             print("All substitutions have been removed.")
             return
 
@@ -430,18 +674,39 @@ class PythonSubstitutePath(gdb.Command):
                 "This command expects two arguments: original path and substitution path."
             )
         self.substitutions.append((original, substitution))
+        self._rebuild_pattern()
+
+    @classmethod
+    def _rebuild_pattern(cls):
+        """
+        Compile the substitution rules into a single pattern so every rule is tried in one scan.
+        """
+        if cls.substitutions:
+            cls._pattern = re.compile(
+                "|".join(re.escape(original) for original, _ in cls.substitutions)
+            )
+            cls._replacements = {}
+            for original, substitution in cls.substitutions:
+                cls._replacements.setdefault(original, substitution)
+        else:
+            cls._pattern = None
+            cls._replacements = {}
 
     @classmethod
-    def open(cls, path_bytes: bytes, *args):
+    def open(cls, path: bytes | str, *args):
         """
         Wrapper for the "open" function, substituing paths defined by py-substitute-path
+
+        Accepts str as well as bytes paths, so callers that already hold a str don't have to
+        encode it just for it to be decoded again here.
         """
-        path = os.fsdecode(path_bytes)
-        for original, substitution in cls.substitutions:
-            if original in path:
-                path = path.replace(original, substitution)
-                break
-        return open(os.fsencode(path), *args)
+        if cls._pattern is None:
+            # No substitutions configured (the common case): open the path as given.
+            return open(path, *args)
+        substituted = cls._pattern.sub(
+            lambda match: cls._replacements[match.group(0)], os.fsdecode(path)
+        )
+        return open(substituted, *args)
 
 
 PythonSubstitutePath()
@@ -488,3 +753,22 @@ class PyEval(gdb.Command):
 
 PyEval()
 gdb.execute("alias -a pe = py-eval")
+
+
+def _reset_caches(event) -> None:
+    """
+    Drop everything cached about the inferior.
+
+    Loading a new objfile means a different executable or library may be in front of us, so
+    anything derived from the inferior's symbols or memory can be stale.
+    """
+    _python_versions_cache.clear()
+    _function_name_cache.clear()
+    _co_metadata_cache.clear()
+    _disassembly_cache.clear()
+    get_opcode_number.cache_clear()
+    get_c_source_filename.cache_clear()
+    get_c_source_location.cache_clear()
+
+
+gdb.events.new_objfile.connect(_reset_caches)
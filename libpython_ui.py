@@ -1,33 +1,88 @@
 import functools
-import os
 
 import gdb
-import pygments
-import pygments.lexers
-import pygments.formatters
 
 import libpython
 import libpython_extensions
 import tui_windows
 
 
-def highlight_python(content: bytes) -> bytes:
+# Above this size, highlighting with Pygments (a pure-Python tokenizer) takes long enough to
+# stall the first render of a file noticeably.
+HIGHLIGHT_SIZE_LIMIT = 200_000
+
+
+@functools.cache
+def get_highlighter():
     """
-    Applies Python syntax highlighting and prepends line numbers to provided content.
+    Import Pygments and construct the shared lexer and formatter on first use.
+
+    Importing pygments.lexers registers hundreds of lexer entry points, which is not worth
+    paying at gdb startup for sessions that never open the source window.
+    """
+    import pygments
+    import pygments.formatters
+    import pygments.lexers
+
+    return (
+        pygments.highlight,
+        pygments.lexers.PythonLexer(),
+        pygments.formatters.TerminalFormatter(linenos=True),
+    )
+
+
+def prepend_line_numbers(content: str) -> str:
     """
-    return pygments.highlight(
-        content, pygments.lexers.PythonLexer(), pygments.formatters.TerminalFormatter(linenos=True)
+    Prepends line numbers to the provided content, without any highlighting.
+    """
+    return "\n".join(
+        f"{lineno:04d} {line}"
+        for lineno, line in enumerate(content.splitlines(), start=1)
     )
 
 
+@functools.lru_cache(maxsize=16)
+def highlight_python(content: str) -> str:
+    """
+    Applies Python syntax highlighting and prepends line numbers to provided content.
+
+    Repeated identical inputs (e.g. a file re-read after a cache reset) reuse the previous
+    result instead of re-running the tokenizer.
+
+    Files larger than HIGHLIGHT_SIZE_LIMIT only get line numbers, which is cheap. The same
+    plain rendering is used if Pygments is not available in the debugger's Python.
+    """
+    if len(content) > HIGHLIGHT_SIZE_LIMIT:
+        return prepend_line_numbers(content)
+    try:
+        highlight, lexer, formatter = get_highlighter()
+    except ImportError:
+        return prepend_line_numbers(content)
+    return highlight(content, lexer, formatter)
+
+
 @functools.cache
-def get_highlighted_file_content(filename: str) -> str:
+def get_highlighted_file_content(filename: str) -> tuple[str, ...]:
     """
-    Returns the content of the Python source file with syntax highlighting.
+    Returns the lines of the Python source file with syntax highlighting.
+
+    The lines are pre-split so that every render is a cache lookup rather than a re-split of the
+    whole highlighted file.
     """
-    with libpython_extensions.PythonSubstitutePath.open(os.fsencode(filename), "r") as f:
+    with libpython_extensions.PythonSubstitutePath.open(filename, "r") as f:
         content = f.read()
-    return highlight_python(content)
+    return tuple(highlight_python(content).splitlines())
+
+
+@functools.lru_cache(maxsize=8)
+def get_prefixed_file_content(filename: str, current_line: int) -> str:
+    """
+    Returns the highlighted source file content with a marker on the current line.
+    """
+    lines = get_highlighted_file_content(filename)
+    return "\n".join(
+        (" > " if i == current_line else "   ") + l for i, l in enumerate(lines, start=1)
+    )
 
 
 def get_filename_and_line() -> tuple[str, int]:
@@ -56,14 +111,37 @@ class PythonSourceWindow(tui_windows.ScrollableWindow):
 
     def get_content(self):
         filename, line = get_filename_and_line()
-        lines = get_highlighted_file_content(filename).splitlines()
-        prefixed_lines = [(" > " if i == line else "   ") + l for i, l in enumerate(lines, start=1)]
 
         # Set vertical scroll offset to center the current line
         half_window_height = self._tui_window.height // 2
         self.vscroll_offset = line - half_window_height
 
-        return "\n".join(prefixed_lines)
+        return get_prefixed_file_content(filename, line)
+
+
+# Output of py-* commands at the current stop, shared between the windows so each command
+# runs at most once per stop no matter how many times the windows redraw. Keyed by
+# (command, location serial) since py-locals and friends follow the selected frame.
+_command_cache: dict[tuple[str, int], str] = {}
+
+
+def _clear_command_cache(event) -> None:
+    _command_cache.clear()
+
+
+gdb.events.stop.connect(_clear_command_cache)
+gdb.events.cont.connect(_clear_command_cache)
+
+
+def execute_per_stop(command: str) -> str:
+    """
+    Run a gdb command to string, reusing output captured earlier at the same stop with the
+    same selected frame and thread.
+    """
+    key = (command, tui_windows.get_location_serial())
+    if key not in _command_cache:
+        _command_cache[key] = gdb.execute(command, to_string=True)
+    return _command_cache[key]
 
 
 @tui_windows.register_window("python-backtrace")
@@ -71,7 +149,7 @@ class PythonBacktraceWindow(tui_windows.ScrollableWindow):
     title = "Python Backtrace"
 
     def get_content(self):
-        return gdb.execute("py-bt", to_string=True)
+        return execute_per_stop("py-bt")
 
 
 @tui_windows.register_window("python-locals")
@@ -79,7 +157,7 @@ class PythonLocalsWindow(tui_windows.ScrollableWindow):
     title = "Local Python Variables"
 
     def get_content(self):
-        return gdb.execute("py-locals", to_string=True)
+        return execute_per_stop("py-locals")
 
 
 @tui_windows.register_window("python-bytecode")
@@ -87,15 +165,21 @@ class PythonBytecodeWindow(tui_windows.ScrollableWindow):
     title = "Python Bytecode"
 
     def get_lines(self) -> list[str]:
-        lines = gdb.execute("py-dis", to_string=True).splitlines()
-
-        # Set vertical scroll offset to center the current line
-        for index, line in enumerate(lines, start=1):
-            if "-->" in line:
-                half_window_height = self._tui_window.height // 2
-                self.vscroll_offset = index - half_window_height
-
-        return lines
+        libpython_extensions.check_python_bytecode_version()
+        frame = libpython.Frame.get_selected_bytecode_frame()
+        if not frame:
+            return ["Unable to find frame with bytecode"]
+        raw = libpython_extensions.get_frame_disassembly(frame)
+
+        # Set vertical scroll offset to center the current line. Locating the marker in the
+        # raw block keeps the whole search in C string code.
+        marker = raw.find("-->")
+        if marker >= 0:
+            current_line = raw.count("\n", 0, marker) + 1
+            half_window_height = self._tui_window.height // 2
+            self.vscroll_offset = current_line - half_window_height
+
+        return raw.splitlines()
 
 
 # Define a layout with all Python windows
@@ -7,6 +7,54 @@ import traceback
 class GlobalState:
     count = 0
 
+
+# Set RACE_FAST_RNG=1 to draw increments from preallocated numpy batches instead of calling
+# random.randint per iteration. Off by default to keep the demo's original timing profile.
+if os.environ.get("RACE_FAST_RNG"):
+    import numpy
+
+    _rng = numpy.random.default_rng()
+    _batch_size = 1 << 16
+    _batch = _rng.integers(1, 6, size=_batch_size)
+    _batch_index = 0
+
+    def fast_randint():
+        # Refill the batch when exhausted; one bulk RNG call replaces 65536 Python-level ones.
+        global _batch, _batch_index
+        if _batch_index >= _batch_size:
+            _batch = _rng.integers(1, 6, size=_batch_size)
+            _batch_index = 0
+        value = int(_batch[_batch_index])
+        _batch_index += 1
+        return value
+
+else:
+
+    def fast_randint():
+        return random.randint(1, 5)
+
+
+# Iterations folded into one increment when RACE_NUMBA chunking is enabled.
+CHUNK_ITERATIONS = 1024
+
+
+def hot_increment(count, seed):
+    total = 0
+    for i in range(count):
+        total += (seed * i) % 5 + 1
+    return total
+
+
+# Set RACE_NUMBA=1 to JIT-compile the chunked arithmetic with numba; the compiled loop also
+# releases the GIL. Falls back to the pure Python version if numba is not installed.
+if os.environ.get("RACE_NUMBA"):
+    try:
+        import numba
+    except ImportError:
+        pass
+    else:
+        hot_increment = numba.njit(nogil=True)(hot_increment)
+
 # Shared variable
 g_value = GlobalState()
 # Lock for synchronization
@@ -16,13 +64,22 @@ lock = threading.Lock()
 def thread_fn_1():
     global g_value
 
+    chunked = bool(os.environ.get("RACE_NUMBA"))
     iteration = 0
+    # Count down to the next progress print instead of taking a modulo every iteration.
+    next_print = 1
     while True:
         with lock:
-            if iteration % (10 * 1000) == 0:
+            next_print -= 1
+            if next_print == 0:
+                next_print = 10 * 1000
                 print(f"thread 1: {iteration=}")
             old_value = g_value.count
-            increment = random.randint(1, 5)
+            if chunked:
+                # One compiled call covers a whole chunk of iterations.
+                increment = hot_increment(CHUNK_ITERATIONS, iteration + 1)
+            else:
+                increment = fast_randint()
             g_value.count += increment
             assert (
                 g_value.count == old_value + increment
@@ -34,8 +91,11 @@ def thread_fn_2():
     global g_value
 
     iteration = 0
+    next_print = 1
     while True:
-        if iteration % 100 == 0:
+        next_print -= 1
+        if next_print == 0:
+            next_print = 100
             print(f"thread 2: {iteration=}")
         g_value.count += 1
         iteration += 1
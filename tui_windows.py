@@ -4,8 +4,28 @@ from typing import Callable
 import gdb
 
 
-# A pattern to match an ANSI escape sequence
-ANSI_PATTERN = re.compile(r"(\x1b(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~]))")
+# A pattern to match an ANSI escape sequence. No capture group: nothing splits on it, and the
+# backtracker does less bookkeeping per match without one.
+ANSI_PATTERN = re.compile(r"\x1b(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])")
+
+# Bound methods of the pattern, saving an attribute lookup per use in the render hot paths.
+_ANSI_MATCH = ANSI_PATTERN.match
+_ANSI_FINDITER = ANSI_PATTERN.finditer
+
+
+def visible_len(line: str) -> int:
+    """
+    Return the number of characters in the line that count towards its displayed width.
+
+    Subtracting the span of each escape sequence avoids allocating a stripped copy of the
+    line just to measure it.
+    """
+    if "\x1b" not in line:
+        return len(line)
+    length = len(line)
+    for match in _ANSI_FINDITER(line):
+        length -= match.end() - match.start()
+    return length
 
 
 def truncate_ansi_string(string: str, start: int, length: int) -> str:
@@ -33,35 +53,49 @@ def truncate_ansi_string(string: str, start: int, length: int) -> str:
     """
     if start < 0 or length < 0:
         raise ValueError("start and length must be non-negative")
+    if "\x1b" not in string:
+        # No escape sequences (the common case): truncation is a plain slice.
+        return string[start : start + length]
     output = []
     position = 0
     end = start + length
-    for component in re.split(ANSI_PATTERN, string):
-        if re.match(ANSI_PATTERN, component):
-            # ANSI sequences don't count towards the length, but should still be emitted.
-            output.append(component)
-        else:
+    index = 0
+    while index < len(string):
+        # Jump to the next well-formed escape sequence; a stray ESC is ordinary text.
+        match = None
+        escape_start = string.find("\x1b", index)
+        while escape_start >= 0:
+            match = _ANSI_MATCH(string, escape_start)
+            if match:
+                break
+            escape_start = string.find("\x1b", escape_start + 1)
+        component = string[index:] if match is None else string[index:escape_start]
+        if component:
             # This is some normal text.
             remaining_to_start = max(0, start - position)
             if len(component) <= remaining_to_start:
                 # Skip this component, it's completely before the start of the output
                 position += len(component)
-                continue
-            elif remaining_to_start and len(component) > remaining_to_start:
-                # Skip the part of the component which is before the start of the output range, then
-                # carry on to process the remainder of the component as usual.
-                component = component[remaining_to_start:]
-                position += remaining_to_start
-            remaining_to_end = max(0, end - position)
-            if remaining_to_end <= 0:
-                # No more space left. Keep going to consume any remaining ANSI sequences.
-                pass
-            if len(component) <= remaining_to_end:
-                output.append(component)
             else:
-                # The component is too long to fit in the output, split it up
-                output.append(component[:remaining_to_end])
-            position += len(component)
+                if remaining_to_start:
+                    # Skip the part of the component which is before the start of the output
+                    # range, then carry on to process the remainder of the component as usual.
+                    component = component[remaining_to_start:]
+                    position += remaining_to_start
+                remaining_to_end = max(0, end - position)
+                if len(component) <= remaining_to_end:
+                    output.append(component)
+                else:
+                    # The component is too long to fit in the output, split it up. When no
+                    # space is left this appends nothing, but we keep going to emit any
+                    # remaining ANSI sequences.
+                    output.append(component[:remaining_to_end])
+                position += len(component)
+        if match is None:
+            break
+        # ANSI sequences don't count towards the length, but should still be emitted.
+        output.append(match.group())
+        index = match.end()
     return "".join(output)
 
 
@@ -78,6 +112,35 @@ def register_window(name: str) -> Callable:
     return decorator
 
 
+# Identity of the selected thread and frame. Commands like "frame", "up" or "thread" switch
+# the selection without firing any gdb event, so renders compare serials instead of relying
+# on stop/cont events alone.
+_location_serial = 0
+_last_location = None
+
+
+def get_location_serial() -> int:
+    """
+    Return a serial number that changes whenever the selected thread or frame does.
+    """
+    global _location_serial, _last_location
+    try:
+        thread = gdb.selected_thread()
+        frame = gdb.selected_frame()
+        location = (
+            thread.global_num if thread is not None else None,
+            frame.level(),
+            int(frame.pc()),
+        )
+    except gdb.error:
+        # No inferior running or no frame selected.
+        location = None
+    if location != _last_location:
+        _last_location = location
+        _location_serial += 1
+    return _location_serial
+
+
 class ScrollableWindow:
     """
     Base class for displaying simple content in a scrollable TUI window.
@@ -96,13 +159,30 @@ class ScrollableWindow:
         # When scrolling we use cached lines to avoid regenerating the content.
         self.use_cached_lines = False
         self.cached_lines = None
+        # Horizontally-truncated lines for the current (offset, width), reused across
+        # vertical scrolling.
+        self._htrunc_cache = None
         self.vscroll_offset = 0
         self.hscroll_offset = 0
 
+        # Prompts fire for commands that don't move the inferior (help, set, ...); only
+        # regenerate content once something may have changed it.
+        self._dirty = True
+        self._last_output = None
+        self._last_geometry = None
+        self._last_location_serial = None
+
         gdb.events.before_prompt.connect(self.render)
+        gdb.events.stop.connect(self._mark_dirty)
+        gdb.events.cont.connect(self._mark_dirty)
 
     def close(self) -> None:
         gdb.events.before_prompt.disconnect(self.render)
+        gdb.events.stop.disconnect(self._mark_dirty)
+        gdb.events.cont.disconnect(self._mark_dirty)
+
+    def _mark_dirty(self, event=None) -> None:
+        self._dirty = True
 
     def get_content(self) -> str:
         """
@@ -127,7 +207,7 @@ class ScrollableWindow:
         """
         try:
             return self.get_lines()
-        except gdb.error as exc:
+        except (gdb.error, gdb.GdbError) as exc:
             return [str(exc)]
 
     def get_viewport_content(self) -> str:
@@ -136,100 +216,186 @@ class ScrollableWindow:
         current window size and scroll offsets.
         """
         if self.use_cached_lines and self.cached_lines is not None:
-            lines, content_height, content_width = self.cached_lines
+            lines, widths, content_height, content_width = self.cached_lines
             self.use_cached_lines = False
         else:
             lines = self.get_lines_or_error()
             if lines:
+                # Visible width of each line, stored alongside the lines so scroll events
+                # skip the whole pass.
+                widths = [visible_len(l) for l in lines]
                 content_height = len(lines)
-                content_width = max(len(ANSI_PATTERN.sub("", l)) for l in lines)
-                self.cached_lines = (lines, content_height, content_width)
+                content_width = max(widths)
+                self.cached_lines = (lines, widths, content_height, content_width)
+                self._htrunc_cache = None
 
         if not lines:
             return ""
 
+        tui_window = self._tui_window
+
         # Limit scroll to the content height
-        window_height = self._tui_window.height
+        window_height = tui_window.height
         self.vscroll_offset = min(content_height - window_height, self.vscroll_offset)
         self.vscroll_offset = max(0, self.vscroll_offset)
 
-        # Truncate content vertically
-        free_height = window_height - content_height
-        if free_height < 0:
-            # We have to truncate the height, after adjusting for scroll.
-            scrolled_free_height = window_height - (content_height - self.vscroll_offset)
-            if scrolled_free_height >= 0:
-                lines = lines[self.vscroll_offset :]
-            else:
-                lines = lines[self.vscroll_offset : self.vscroll_offset + window_height]
-
         # Limit scroll to the content width
-        window_width = self._tui_window.width - 1
+        window_width = tui_window.width - 1
         self.hscroll_offset = min(content_width - window_width, self.hscroll_offset)
         self.hscroll_offset = max(0, self.hscroll_offset)
 
-        # Truncate content horizontally
-        truncated_lines = [
-            truncate_ansi_string(l, self.hscroll_offset, window_width) for l in lines
-        ]
+        # Truncate content horizontally. Escape-free lines (the common case) are plain
+        # slices; only lines with ANSI sequences need the full scanner. The truncated list
+        # is kept so vertical scrolling, which doesn't change it, just re-slices below.
+        hscroll_offset = self.hscroll_offset
+        cache_key = (hscroll_offset, window_width)
+        if self._htrunc_cache is not None and self._htrunc_cache[0] == cache_key:
+            truncated_lines = self._htrunc_cache[1]
+        elif hscroll_offset == 0:
+            # Unscrolled, truncation is a no-op for every line that already fits; the
+            # cached visible widths tell us which ones those are.
+            truncated_lines = [
+                l
+                if width <= window_width
+                else (
+                    l[:window_width]
+                    if "\x1b" not in l
+                    else truncate_ansi_string(l, 0, window_width)
+                )
+                for l, width in zip(lines, widths)
+            ]
+            self._htrunc_cache = (cache_key, truncated_lines)
+        else:
+            truncated_lines = [
+                l[hscroll_offset : hscroll_offset + window_width]
+                if "\x1b" not in l
+                else truncate_ansi_string(l, hscroll_offset, window_width)
+                for l in lines
+            ]
+            self._htrunc_cache = (cache_key, truncated_lines)
+
+        # Truncate content vertically, adjusting for scroll.
+        if content_height > window_height:
+            truncated_lines = truncated_lines[
+                self.vscroll_offset : self.vscroll_offset + window_height
+            ]
 
         return "\n".join(truncated_lines)
 
     def render(self) -> None:
-        if not self._tui_window.is_valid():
+        tui_window = self._tui_window
+        if not tui_window.is_valid():
+            return
+        geometry = (tui_window.width, tui_window.height)
+        serial = get_location_serial()
+        if serial != self._last_location_serial:
+            # The selected thread or frame moved under us without any event firing.
+            self._last_location_serial = serial
+            self._dirty = True
+        if (
+            not self._dirty
+            and geometry == self._last_geometry
+            and self._last_output is not None
+        ):
+            # Nothing changed since the last render; the window already displays this
+            # output, so don't erase and rewrite it.
             return
         output = self.get_viewport_content()
-        self._tui_window.write(output, True)
+        unchanged = geometry == self._last_geometry and output == self._last_output
+        self._last_output = output
+        self._last_geometry = geometry
+        self._dirty = False
+        if unchanged:
+            # The window already displays exactly this; skip the erase-and-rewrite that
+            # makes the TUI visibly blank between updates.
+            return
+        tui_window.write(output, True)
 
     def vscroll(self, num: int) -> None:
         self.vscroll_offset += num
         self.use_cached_lines = True
+        self._dirty = True
         self.render()
 
     def hscroll(self, num: int) -> None:
         self.hscroll_offset += num
         self.use_cached_lines = True
+        self._dirty = True
         self.render()
 
 
+# Styled command output captured since the last stop, shared across windows and redraws and
+# stored pre-split. "info timeline" in particular is expensive to regenerate. Keyed by
+# (command, location serial) since commands like "info locals" follow the selected frame.
+_styled_output_cache: dict[tuple[str, int], list[str]] = {}
+
+
+def _clear_styled_output_cache(event) -> None:
+    _styled_output_cache.clear()
+
+
+gdb.events.stop.connect(_clear_styled_output_cache)
+gdb.events.cont.connect(_clear_styled_output_cache)
+gdb.events.new_objfile.connect(_clear_styled_output_cache)
+
+
+def execute_styled_lines(command: str) -> list[str]:
+    """
+    Run a gdb command, returning its styled output as lines.
+
+    Output captured since the last stop is reused while the selected frame and thread are
+    unchanged, and it is split only once when captured, so windows re-rendering within one
+    stop share both the execution and the split.
+    """
+    key = (command, get_location_serial())
+    if key not in _styled_output_cache:
+        _styled_output_cache[key] = gdb.execute(
+            command, to_string=True, styled=True
+        ).splitlines()
+    return _styled_output_cache[key]
+
+
+class CommandWindow(ScrollableWindow):
+    """
+    Scrollable window displaying the styled output of a fixed gdb command.
+
+    Subclasses must define a `command` attribute alongside `title`.
+    """
+
+    command: str | None = None
+
+    def get_lines(self) -> list[str]:
+        return execute_styled_lines(self.command)
+
+
 @register_window("locals")
-class LocalsWindow(ScrollableWindow):
+class LocalsWindow(CommandWindow):
     title = "Local Variables"
-
-    def get_content(self) -> str:
-        return gdb.execute("info locals", to_string=True, styled=True)
+    command = "info locals"
 
 
 @register_window("backtrace")
-class BacktraceWindow(ScrollableWindow):
+class BacktraceWindow(CommandWindow):
     title = "Backtrace"
-
-    def get_content(self) -> str:
-        return gdb.execute("backtrace", to_string=True, styled=True)
+    command = "backtrace"
 
 
 @register_window("threads")
-class ThreadsWindow(ScrollableWindow):
+class ThreadsWindow(CommandWindow):
     title = "Threads"
-
-    def get_content(self) -> str:
-        return gdb.execute("info threads", to_string=True, styled=True)
+    command = "info threads"
 
 
 @register_window("breakpoints")
-class BreakpointsWindow(ScrollableWindow):
+class BreakpointsWindow(CommandWindow):
     title = "Breakpoints"
-
-    def get_content(self) -> str:
-        return gdb.execute("info breakpoints", to_string=True, styled=True)
+    command = "info breakpoints"
 
 
 @register_window("timeline")
-class TimelineWindow(ScrollableWindow):
+class TimelineWindow(CommandWindow):
     title = "Timeline"
-
-    def get_content(self) -> str:
-        return gdb.execute("info timeline", to_string=True, styled=True)
+    command = "info timeline"
 
 
 gdb.execute(